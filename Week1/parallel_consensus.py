@@ -1,29 +1,37 @@
 import os
+import sys
 import asyncio
-from openai import AsyncOpenAI
 from dotenv import load_dotenv
 from colorama import Fore, Style, init
 
 init(autoreset=True)
 load_dotenv()
 
-# Use Async client for parallel execution
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Shared Async client behind a concurrency gate + retry for parallel execution
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # repo root, for common/
+from common.llm_gate import guarded_create
 
-# --- 1. DEFINE THE WORKER ---
-async def ask_agent(name, prompt, color):
-    """Runs a single LLM call independently."""
-    print(f"{color}🤖 {name} is thinking...{Style.RESET_ALL}")
+# --- 1. DEFINE THE WORKERS ---
+AGENT_COLORS = [Fore.YELLOW, Fore.CYAN, Fore.MAGENTA]
+
+async def ask_agents(prompt, n=3):
+    """Samples n independent answers in ONE request (n=...) instead of n calls."""
+    for i in range(n):
+        print(f"{AGENT_COLORS[i % len(AGENT_COLORS)]}🤖 Agent {chr(65 + i)} is thinking...{Style.RESET_ALL}")
     
-    response = await client.chat.completions.create(
+    # The prompt is sent and prefilled once; the engine samples n completions from it
+    response = await guarded_create(
         model="gpt-4",
         messages=[{"role": "user", "content": prompt}],
-        temperature=0.7 # High temp to encourage diversity of thought
+        temperature=0.7, # High temp to encourage diversity of thought
+        n=n
     )
     
-    content = response.choices[0].message.content
-    print(f"{color}✅ {name} finished.{Style.RESET_ALL}")
-    return f"{name}: {content}"
+    results = []
+    for i, choice in enumerate(response.choices):
+        print(f"{AGENT_COLORS[i % len(AGENT_COLORS)]}✅ Agent {chr(65 + i)} finished.{Style.RESET_ALL}")
+        results.append(f"Agent {chr(65 + i)}: {choice.message.content}")
+    return results
 
 # --- 2. THE ORCHESTRATOR ---
 async def run_consensus(topic):
@@ -32,28 +40,28 @@ async def run_consensus(topic):
     prompt = f"Provide a brief, 1-sentence interesting fact about: {topic}"
     
     # 1. Parallel Execution (Scatter)
-    # We launch 3 requests simultaneously, not sequentially
-    results = await asyncio.gather(
-        ask_agent("Agent A", prompt, Fore.YELLOW),
-        ask_agent("Agent B", prompt, Fore.CYAN),
-        ask_agent("Agent C", prompt, Fore.MAGENTA)
-    )
+    # 3 samples from a single request: one round-trip instead of 3
+    results = await ask_agents(prompt, n=3)
     
     # 2. Aggregation (Gather)
     print(f"\n{Fore.WHITE}--- AGGREGATING RESULTS ---{Style.RESET_ALL}")
     combined_text = "\n".join(results)
     print(combined_text)
     
-    # 3. Final Decision (Judge)
+    # 3. Final Decision (Judge), streamed as it is generated
     print(f"\n{Fore.GREEN}--- FINAL JUDGMENT ---{Style.RESET_ALL}")
-    final_verdict = await client.chat.completions.create(
+    verdict_stream = await guarded_create(
         model="gpt-4",
         messages=[
-            {"role": "system", "content": "You are a Judge. Synthesize the following 3 facts into one definitive truth."},
+            {"role": "system", "content": f"You are a Judge. Synthesize the following {len(results)} facts into one definitive truth."},
             {"role": "user", "content": combined_text}
-        ]
+        ],
+        stream=True
     )
-    print(final_verdict.choices[0].message.content)
+    async for chunk in verdict_stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            print(chunk.choices[0].delta.content, end="", flush=True)
+    print()
 
 if __name__ == "__main__":
     asyncio.run(run_consensus("The origin of the Python programming language name"))
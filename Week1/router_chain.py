@@ -1,30 +1,34 @@
 
 
 import os
+import sys
 import json
-from openai import OpenAI
+import asyncio
 from dotenv import load_dotenv
 from colorama import Fore, Style, init
 
 # Initialize colors and Env
 init(autoreset=True)
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # repo root, for common/
+from common.llm_gate import guarded_create
+from common.intent_router import classify_batch, MIN_CONFIDENCE
 
 # --- 1. DEFINE SPECIALIZED HANDLERS ---
-def handle_billing(query):
+async def handle_billing(query):
     """Simulates a specialized Billing Agent."""
     print(f"{Fore.YELLOW}⚡ Routing to BILLING System...{Style.RESET_ALL}")
     # In reality, this might query a SQL database or Stripe API
     return "Billing Agent: I see your last payment of $49.99 was processed on Jan 1st."
 
-def handle_technical(query):
+async def handle_technical(query):
     """Simulates a specialized Tech Support Agent."""
     print(f"{Fore.CYAN}⚡ Routing to TECHNICAL Support...{Style.RESET_ALL}")
     # In reality, this might query Vector DB (RAG) docs
     return "Tech Agent: To reset your password, please go to Settings > Security."
 
-def handle_general(query):
+async def handle_general(query):
     """Fallback for general queries."""
     print(f"{Fore.GREEN}⚡ Routing to GENERAL Chat...{Style.RESET_ALL}")
     return "General Agent: I can help you with that. What specifically do you need?"
@@ -32,48 +36,111 @@ def handle_general(query):
 # --- 2. THE ROUTER (CLASSIFIER) ---
 ROUTER_PROMPT = """
 You are a Customer Support Router.
-Classify the user query into one of these categories:
-- BILLING (Payments, refunds, invoices)
-- TECHNICAL (Bugs, login issues, configuration)
-- GENERAL (Everything else)
-
-Output ONLY the category name. Do not explain.
+Route the user query by calling exactly one handler:
+- handle_billing (Payments, refunds, invoices)
+- handle_technical (Bugs, login issues, configuration)
+- handle_general (Everything else)
 """
 
-def route_query(query):
+# The handlers are exposed as tools, so the model's single reply is the dispatch
+# decision itself (same native-tools pattern as smart_investor_nativetools.py)
+def _handler_schema(name, description):
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": description,
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "The user's original query"}
+                },
+                "required": ["query"]
+            }
+        }
+    }
+
+tools_schema = [
+    _handler_schema("handle_billing", "Billing questions: payments, refunds, invoices."),
+    _handler_schema("handle_technical", "Technical support: bugs, login issues, configuration."),
+    _handler_schema("handle_general", "Everything that is not billing or technical.")
+]
+
+# Route -> handler (anything unmatched falls back to handle_general)
+_HANDLERS = {
+    "BILLING": handle_billing,
+    "TECHNICAL": handle_technical
+}
+
+# Router decisions are deterministic (temperature=0), so repeated queries
+# can reuse the earlier tool choice instead of paying another round-trip.
+_route_cache = {}
+
+def normalize_query(query):
+    """Cache-key normalization: lowercase, strip, collapse whitespace."""
+    return " ".join(query.lower().split())
+
+async def llm_route(query):
+    """Asks GPT-4 to pick a handler tool (one call, result cached per normalized query)."""
+    cache_key = normalize_query(query)
+    handler_name = _route_cache.get(cache_key)
+    if handler_name is None:
+        response = await guarded_create(
+            model="gpt-4",
+            messages=[
+                {"role": "system", "content": ROUTER_PROMPT},
+                {"role": "user", "content": query}
+            ],
+            tools=tools_schema,
+            tool_choice="required",  # Always answer with a handler call
+            temperature=0.0  # Zero temp for strict classification
+        )
+        handler_name = response.choices[0].message.tool_calls[0].function.name
+        _route_cache[cache_key] = handler_name
+    return handler_name
+
+async def route_query(query, local_guess=None):
     print(f"\n{Fore.WHITE}User Query: {query}{Style.RESET_ALL}")
     
-    # 1. The Classification Step (Deterministically limiting output)
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": ROUTER_PROMPT},
-            {"role": "user", "content": query}
-        ],
-        temperature=0.0  # Zero temp for strict classification
-    )
-    
-    route = response.choices[0].message.content.strip().upper()
+    # 1. The Classification Step
+    # Local embedding classifier first; GPT-4 only when it is unsure
+    label, score = local_guess or classify_batch([query])[0]
+    if label is not None and score >= MIN_CONFIDENCE:
+        route = label
+    else:
+        route = (await llm_route(query)).removeprefix("handle_").upper()
     print(f"{Fore.MAGENTA}🔍 Router Decision: {route}{Style.RESET_ALL}")
     
-    # 2. The Branching Logic (Python Control Flow)
-    if "BILLING" in route:
-        return handle_billing(query)
-    elif "TECHNICAL" in route:
-        return handle_technical(query)
-    else:
-        return handle_general(query)
+    # 2. Execute the chosen handler locally (dict lookup, not an if/elif chain)
+    # Normalizing to a known key keeps the old substring-match semantics
+    key = next((k for k in _HANDLERS if k in route), None)
+    return await _HANDLERS.get(key, handle_general)(query)
+
+async def route_query_batch(queries):
+    """Routes many queries concurrently instead of one round-trip at a time."""
+    # One batched embedding pass for the whole list
+    guesses = classify_batch(queries)
+    return await asyncio.gather(*[route_query(q, guess) for q, guess in zip(queries, guesses)])
 
 # --- 3. DEMO EXECUTION ---
-if __name__ == "__main__":
+async def main():
     # Test Case 1: Billing
-    print(route_query("I was charged twice for my subscription."))
+    print(await route_query("I was charged twice for my subscription."))
     
     # Test Case 2: Technical
-    print(route_query("I can't log in, I get a 403 error."))
+    print(await route_query("I can't log in, I get a 403 error."))
     
     # Test Case 3: General
-    print(route_query("Tell me a joke about AI."))
-    
+    print(await route_query("Tell me a joke about AI."))
 
-    
\ No newline at end of file
+    # Batch: all three queries routed concurrently (one wait instead of three)
+    for answer in await route_query_batch([
+        "I was charged twice for my subscription.",
+        "I can't log in, I get a 403 error.",
+        "Tell me a joke about AI."
+    ]):
+        print(answer)
+
+if __name__ == "__main__":
+    # One event loop for the whole demo so the async client's connections are reused
+    asyncio.run(main())
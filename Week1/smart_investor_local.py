@@ -3,13 +3,16 @@
 
 import os
 import re
-from openai import OpenAI
+import sys
+import asyncio
 from dotenv import load_dotenv
 
 # Load API Key from .env file
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # repo root, for common/
+from common.llm_gate import guarded_create
 
 # --- 1. DEFINE TOOLS ---
 def get_stock_price(ticker):
@@ -42,8 +45,36 @@ Action: get_stock_price[AAPL]
 PAUSE
 """
 
+# Looking for: Action: tool_name[input]
+# Compiled once; [^\]]* (instead of .*) stops at the first ']' with no backtracking
+_ACTION_RE = re.compile(r"Action:\s+(\w+)\[([^\]]*)\]")
+
 # --- 3. THE AGENT LOOP ---
-def run_agent(user_query):
+async def stream_turn(messages):
+    """
+    Streams one LLM turn and stops as soon as 'Action: tool[input]' + 'PAUSE'
+    has arrived, so the model's hallucinated Observation is never generated.
+    """
+    stream = await guarded_create(
+        model="gpt-4",
+        messages=messages,
+        stream=True
+    )
+    buffer = ""
+    async for chunk in stream:
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            continue
+        buffer += chunk.choices[0].delta.content
+
+        action_match = _ACTION_RE.search(buffer)
+        if action_match and "Final Answer:" not in buffer:
+            pause_idx = buffer.find("PAUSE", action_match.end())
+            if pause_idx != -1:
+                await stream.close()  # Cancel the rest of the generation
+                return buffer[:pause_idx + len("PAUSE")]
+    return buffer
+
+async def run_agent(user_query):
     print(f"User: {user_query}\n")
     messages = [
         {"role": "system", "content": SYSTEM_PROMPT},
@@ -54,12 +85,8 @@ def run_agent(user_query):
     for turn in range(5):
         print(f"--- Turn {turn + 1} ---")
         
-        # Call LLM
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=messages
-        )
-        agent_text = response.choices[0].message.content
+        # Call LLM (streamed, cut off at PAUSE)
+        agent_text = await stream_turn(messages)
         print(f"Agent: {agent_text}")
         
         # Add agent response to history
@@ -70,9 +97,8 @@ def run_agent(user_query):
             print("\n✅ Task Complete!")
             return agent_text
             
-        # Parse Action using Regex
-        # Looking for: Action: tool_name[input]
-        action_match = re.search(r"Action: (\w+)\[(.*)\]", agent_text)
+        # Parse Action using the pre-compiled Regex
+        action_match = _ACTION_RE.search(agent_text)
         
         if action_match:
             tool_name = action_match.group(1)
@@ -102,5 +128,5 @@ def run_agent(user_query):
 # --- 4. EXECUTION ---
 if __name__ == "__main__":
     # Ensure you have OPENAI_API_KEY in your .env file
-    run_agent("Is Nvidia a good buy right now? Check price and news.")
+    asyncio.run(run_agent("Is Nvidia a good buy right now? Check price and news."))
     
\ No newline at end of file
@@ -1,20 +1,23 @@
 import os
-import json
-from openai import OpenAI
+import sys
+import orjson
+import asyncio
 from dotenv import load_dotenv
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # repo root, for common/
+from common.llm_gate import guarded_response
 
 # --- 1. DEFINE TOOLS (The "Hands") ---
-def get_stock_price(ticker):
+async def get_stock_price(ticker):
     """Fetches the current stock price."""
     # Mock data - in prod this hits an API
-    return json.dumps({"ticker": ticker, "price": 215.40, "currency": "USD"})
+    return orjson.dumps({"ticker": ticker, "price": 215.40, "currency": "USD"}).decode()
 
-def get_news(ticker):
+async def get_news(ticker):
     """Searches for recent news about a company."""
-    return json.dumps({"ticker": ticker, "news": "Earnings beat expectations. Analysts bullish."})
+    return orjson.dumps({"ticker": ticker, "news": "Earnings beat expectations. Analysts bullish."}).decode()
 
 # --- 2. DEFINE TOOL SCHEMAS (The "API Definition") ---
 # This JSON schema tells OpenAI exactly what functions are available
@@ -56,60 +59,72 @@ available_functions = {
     "get_news": get_news
 }
 
+# The Responses API takes the same schema, flattened (no nested "function" key)
+responses_tools = [{"type": "function", **t["function"]} for t in tools_schema]
+
+SYSTEM_PROMPT = "You are a helpful financial assistant. Use tools to answer questions."
+
 # --- 3. THE AGENT LOOP ---
-def run_native_agent(query):
+async def run_native_agent(query):
     print(f"User: {query}\n")
-    messages = [
-        {"role": "system", "content": "You are a helpful financial assistant. Use tools to answer questions."},
-        {"role": "user", "content": query}
-    ]
+
+    # The server keeps the conversation; each turn only uploads what is new
+    # (the user query first, then tool outputs) and points at the previous response.
+    new_input = [{"role": "user", "content": query}]
+    last_id = None
 
     for turn in range(5): # Max 5 turns safety limit
         print(f"--- Turn {turn + 1} ---")
         
         # 1. Call LLM with Tools enabled
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=messages,
-            tools=tools_schema,
-            tool_choice="auto" # Let the model decide whether to use a tool or chat
-        )
+        kwargs = {
+            "model": "gpt-4o",
+            "instructions": SYSTEM_PROMPT,  # Not inherited via previous_response_id
+            "input": new_input,
+            "tools": responses_tools,
+            "tool_choice": "auto" # Let the model decide whether to use a tool or chat
+        }
+        if last_id:
+            kwargs["previous_response_id"] = last_id
+        response = await guarded_response(**kwargs)
+        last_id = response.id
         
-        msg = response.choices[0].message
-        tool_calls = msg.tool_calls
+        tool_calls = [item for item in response.output if item.type == "function_call"]
 
         # 2. Check if the model wants to call a tool
         if tool_calls:
             print(f"🤖 Agent wants to call {len(tool_calls)} tool(s)...")
             
-            # Important: Add the assistant's request to history
-            messages.append(msg) 
-            
-            # 3. Execute Tools
+            # 3. Execute Tools (all calls from this turn run concurrently)
+            calls = []
             for tool_call in tool_calls:
-                function_name = tool_call.function.name
-                function_args = json.loads(tool_call.function.arguments)
+                function_name = tool_call.name
+                function_args = orjson.loads(tool_call.arguments)
                 
                 print(f"⚙️ Calling: {function_name}({function_args})")
                 
                 function_to_call = available_functions[function_name]
-                function_response = function_to_call(**function_args)
-                
-                # 4. Feed Output back to LLM
-                # We must include the 'tool_call_id' so the LLM knows which request this answer belongs to
-                messages.append({
-                    "tool_call_id": tool_call.id,
-                    "role": "tool",
-                    "name": function_name,
-                    "content": function_response
+                calls.append(function_to_call(**function_args))
+
+            # gather() keeps results in the same order as tool_calls
+            function_responses = await asyncio.gather(*calls)
+            
+            # 4. Feed Output back to LLM
+            # We must include the 'call_id' so the LLM knows which request this answer belongs to
+            new_input = []
+            for tool_call, function_response in zip(tool_calls, function_responses):
+                new_input.append({
+                    "type": "function_call_output",
+                    "call_id": tool_call.call_id,
+                    "output": function_response
                 })
                 print(f"👀 Observation: {function_response}")
         
         else:
             # No tool calls? The model has finished its task.
-            print(f"✅ Final Answer: {msg.content}")
+            print(f"✅ Final Answer: {response.output_text}")
             break
 
 if __name__ == "__main__":
     # This query forces the agent to use BOTH tools
-    run_native_agent("What is the price of NVDA and is there any good news?")
\ No newline at end of file
+    asyncio.run(run_native_agent("What is the price of NVDA and is there any good news?"))
\ No newline at end of file
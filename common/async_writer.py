@@ -0,0 +1,75 @@
+import os
+import asyncio
+import contextlib
+
+import aiofiles
+
+# Background writer for non-critical artifacts (reports, logs).
+# The agent enqueues (path, content) and moves on; a single flusher task drains
+# the queue, coalesces repeated writes to the same path, and writes with aiofiles.
+# fsync only happens once, at shutdown, so disk flushes never sit on the agent's path.
+#
+# Usage:
+#   from common.async_writer import enqueue_write, shutdown_writer
+#   await enqueue_write("data/report.txt", text)
+#   ...
+#   await shutdown_writer()  # before the event loop exits
+
+_queue = None
+_flusher_task = None
+_written_paths = set()
+
+async def _flusher():
+    while True:
+        items = [await _queue.get()]
+        # Drain whatever else is already queued in the same pass
+        while not _queue.empty():
+            items.append(_queue.get_nowait())
+
+        try:
+            batch = dict(items)  # Last write to a path wins
+            for path, content in batch.items():
+                # Any failure (OSError, UnicodeEncodeError, ...) skips this file only;
+                # letting it escape would kill the flusher and hang shutdown_writer()
+                try:
+                    async with aiofiles.open(path, "w") as f:
+                        await f.write(content)
+                    _written_paths.add(path)
+                except Exception as e:
+                    print(f"   [Writer] Failed to write {path}: {e}")
+        finally:
+            for _ in items:
+                _queue.task_done()
+
+def _ensure_started():
+    global _queue, _flusher_task
+    if _flusher_task is None:
+        _queue = asyncio.Queue()
+        _flusher_task = asyncio.create_task(_flusher())
+
+async def enqueue_write(path: str, content: str):
+    """Queues a write and returns immediately."""
+    _ensure_started()
+    await _queue.put((path, content))
+
+def _fsync(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+async def shutdown_writer():
+    """Waits for pending writes, fsyncs everything written, and stops the flusher."""
+    global _queue, _flusher_task
+    if _flusher_task is None:
+        return
+    await _queue.join()
+    _flusher_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await _flusher_task
+    for path in _written_paths:
+        await asyncio.to_thread(_fsync, path)
+    _written_paths.clear()
+    _queue = None
+    _flusher_task = None
@@ -0,0 +1,127 @@
+import os
+
+# Local intent router: embeds the query and picks the closest label prototype.
+# A GPT-4 call just to emit one of three labels costs ~0.5-2s; a MiniLM encode
+# on CPU is ~5ms. Callers fall back to the LLM router when the score is low
+# or no local model is available.
+#
+# Backends, in order of preference:
+#   1. int8 ONNX MiniLM (pip install optimum[onnxruntime]); build it once with
+#      `python -m common.intent_router` from the repo root
+#   2. sentence-transformers MiniLM (pip install sentence-transformers)
+# Both backends need numpy; without it (or without either backend) the router is off.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+try:
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+except ImportError:
+    ORTModelForFeatureExtraction = None
+
+MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+ONNX_DIR = os.getenv("INTENT_ROUTER_ONNX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "mini-int8"))
+ONNX_FILE = "model_quantized.onnx"
+
+LABELS = ["BILLING", "TECHNICAL", "GENERAL"]
+
+# One short description per label, in the same order as LABELS
+_PROTOTYPES = [
+    "billing payment refund invoice",
+    "bug login error configuration",
+    "general question small talk"
+]
+
+# Below this cosine similarity the local guess is not trusted
+MIN_CONFIDENCE = 0.35
+
+class _OnnxEncoder:
+    """
+    int8 ONNX MiniLM behind the same encode() signature as SentenceTransformer.
+    Dynamic int8 quantization uses VNNI dot products on recent CPUs: ~2x faster
+    encode and a ~4x smaller model, with no visible change for 3-way routing.
+    """
+    def __init__(self, model_dir: str):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(model_dir, file_name=ONNX_FILE)
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False, convert_to_numpy=True):
+        chunks = []
+        for start in range(0, len(sentences), batch_size):
+            tokens = self.tokenizer(
+                sentences[start:start + batch_size],
+                padding=True, truncation=True, return_tensors="np"
+            )
+            hidden = np.asarray(self.model(**tokens).last_hidden_state)
+            # Mean pooling over real (non-padding) tokens, as sentence-transformers does
+            mask = tokens["attention_mask"][..., None].astype(hidden.dtype)
+            chunks.append((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        embeddings = np.concatenate(chunks)
+        if normalize_embeddings:
+            embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
+
+def export_int8(model_id: str = MODEL_ID, save_dir: str = ONNX_DIR):
+    """One-off: export MiniLM to ONNX and write a dynamically quantized int8 copy."""
+    from optimum.onnxruntime import ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    model = ORTModelForFeatureExtraction.from_pretrained(model_id, export=True)
+    quantizer = ORTQuantizer.from_pretrained(model)
+    quantizer.quantize(
+        save_dir=save_dir,
+        quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    )
+    AutoTokenizer.from_pretrained(model_id).save_pretrained(save_dir)
+    print(f"Saved int8 model to {save_dir}")
+
+def _load_encoder():
+    if np is None:
+        return None
+    if ORTModelForFeatureExtraction is not None and os.path.exists(os.path.join(ONNX_DIR, ONNX_FILE)):
+        return _OnnxEncoder(ONNX_DIR)
+    if SentenceTransformer is not None:
+        return SentenceTransformer(MODEL_ID)
+    return None
+
+# A failed load (e.g. offline, so the model can't be downloaded) turns the local
+# router off instead of crashing the import; callers then use the LLM router
+try:
+    _enc = _load_encoder()
+    _proto = _enc.encode(_PROTOTYPES, normalize_embeddings=True) if _enc is not None else None
+except Exception as e:
+    print(f"[intent_router] Local model unavailable, using the LLM router: {e}")
+    _enc = None
+    _proto = None
+
+_LABELS_ARR = np.array(LABELS) if np is not None else None
+
+def classify_batch(queries: list[str]):
+    """
+    Classifies all queries in ONE batched forward pass + one matmul.
+    Returns a list of (label, cosine score), or (None, 0.0) per query if the
+    local model is unavailable.
+    """
+    if _enc is None or not queries:
+        return [(None, 0.0)] * len(queries)
+    E = _enc.encode(
+        queries,
+        batch_size=min(len(queries), 64),
+        normalize_embeddings=True,
+        convert_to_numpy=True
+    )
+    scores = E @ _proto.T                  # (n_queries, n_labels)
+    best = scores.argmax(axis=1)
+    labels = _LABELS_ARR[best]
+    confidences = scores[np.arange(len(queries)), best]
+    return [(str(label), float(score)) for label, score in zip(labels, confidences)]
+
+if __name__ == "__main__":
+    export_int8()
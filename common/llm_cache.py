@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+
+try:
+    from langchain_openai import ChatOpenAI
+    from langchain_core.messages import AIMessageChunk, message_chunk_to_message
+except ImportError:
+    ChatOpenAI = None  # Only CachedChatOpenAI needs LangChain; LLMCache works without it
+
+try:
+    import diskcache
+except ImportError:
+    diskcache = None  # Optional: pip install diskcache to keep cache hits across runs
+
+try:
+    from cachetools import TTLCache
+except ImportError:
+    TTLCache = None  # Optional: pip install cachetools for a bounded in-memory cache
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None  # Optional: pip install hnswlib for SemanticCache
+
+# Content-addressed response cache for deterministic LLM calls.
+# The key is sha256 over the full request (model, messages, tools, temperature),
+# so any change to the prompt text or tool set is a different entry, and two
+# callers sending the same request share one. Sampled calls (temperature > 0)
+# are never cached: a hit would freeze one sample forever.
+#
+# Usage:
+#   from common.llm_cache import agent_cache, CachedChatOpenAI
+#   llm = CachedChatOpenAI(model="gpt-4o", temperature=0)   # LangChain nodes
+#   key = agent_cache.cache_key("gpt-4o", messages, 0)      # raw OpenAI calls
+#   response = agent_cache.get(key)
+#
+# SemanticCache is the paraphrase tier on top: "How do I reset my password?" and
+# "How can I reset my password" hash differently but embed almost identically,
+# so one embedding call (~10ms) can stand in for a multi-second completion.
+
+CACHE_DIR = os.getenv("AGENT_CACHE_DIR", os.path.expanduser("~/.agent_cache"))
+# Bounds for long-running servers: entries expire after CACHE_TTL_SECS, and the
+# in-memory backend evicts least-recently-used entries beyond CACHE_MAXSIZE
+CACHE_MAXSIZE = 10_000
+CACHE_TTL_SECS = 60 * 60
+
+class LLMCache:
+    """Key/value cache over any backend with .get() and item assignment (dict, TTLCache, diskcache.Cache)."""
+    def __init__(self, backend=None, ttl=CACHE_TTL_SECS):
+        self.backend = backend if backend is not None else {}
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def cache_key(model, messages, temperature=0, tools=None, extra=None):
+        """
+        Returns the request hash, or None when the call is not cacheable.
+        `extra` holds any other request options that change the output (e.g. response_format).
+        """
+        # temperature=None means the API default (1.0), which samples too
+        if temperature is None or temperature > 0:
+            return None
+        payload = json.dumps(
+            {"model": model, "messages": messages, "tools": tools, "temperature": temperature, "extra": extra},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        if key is None:
+            return None
+        hit = self.backend.get(key)
+        self.stats["hits" if hit is not None else "misses"] += 1
+        return hit
+
+    def set(self, key, value):
+        if key is None:
+            return
+        if diskcache is not None and isinstance(self.backend, diskcache.Cache):
+            self.backend.set(key, value, expire=self.ttl)
+        else:
+            self.backend[key] = value  # TTLCache applies its own ttl
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache over prompt embeddings (HNSW, cosine space).
+    entries maps index label -> (prompt, response, inserted_at), oldest first.
+    Same bounds as the exact tier: entries expire after `ttl` seconds, and past
+    `maxsize` the oldest is evicted, so the index never grows beyond maxsize.
+    """
+    def __init__(self, dim=1536, threshold=0.92, maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL_SECS, path=None):
+        if hnswlib is None:
+            raise ImportError("SemanticCache needs hnswlib: pip install hnswlib")
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.entries = {}
+        self.next_label = 0
+        self.stats = {"hits": 0, "misses": 0}
+        self.index = hnswlib.Index(space="cosine", dim=dim)
+        # allow_replace_deleted: slots of expired/evicted entries are reused by add()
+        self.index.init_index(max_elements=maxsize, ef_construction=200, M=16, allow_replace_deleted=True)
+        if path and os.path.exists(path):
+            self.load()
+
+    def _drop(self, label):
+        # mark_deleted hides the row from knn_query and frees its slot
+        self.index.mark_deleted(label)
+        del self.entries[label]
+
+    def _expire(self):
+        # entries is in insertion order, so the expired ones are at the front
+        cutoff = time.time() - self.ttl
+        while self.entries:
+            label, (_, _, inserted_at) = next(iter(self.entries.items()))
+            if inserted_at > cutoff:
+                break
+            self._drop(label)
+
+    def get(self, embedding):
+        """Returns the cached response of the closest live prompt if it is similar enough."""
+        self._expire()
+        if not self.entries:
+            self.stats["misses"] += 1
+            return None
+        labels, distances = self.index.knn_query(embedding, k=1)
+        # hnswlib's cosine distance is 1 - cosine similarity
+        if 1 - distances[0][0] >= self.threshold:
+            self.stats["hits"] += 1
+            return self.entries[int(labels[0][0])][1]
+        self.stats["misses"] += 1
+        return None
+
+    def add(self, embedding, prompt, response):
+        self._expire()
+        if len(self.entries) >= self.maxsize:
+            self._drop(next(iter(self.entries)))  # Evict the oldest
+        self.index.add_items([embedding], [self.next_label], replace_deleted=True)
+        self.entries[self.next_label] = (prompt, response, time.time())
+        self.next_label += 1
+
+    def save(self):
+        """Persists index + entries; call at shutdown."""
+        if self.path:
+            with open(self.path, "wb") as f:
+                pickle.dump({"index": self.index, "entries": self.entries, "next_label": self.next_label}, f)
+
+    def load(self):
+        with open(self.path, "rb") as f:
+            data = pickle.load(f)
+        if "next_label" not in data:
+            return  # Older file without insert times: start empty rather than serve entries that never expire
+        self.index = data["index"]
+        self.entries = data["entries"]
+        self.next_label = data["next_label"]
+        self._expire()
+
+def _default_backend():
+    # On disk when diskcache is installed (survives restarts), else bounded in memory.
+    # For multi-process deploys, a Redis client wrapper with SET ... EX fits the same interface.
+    if diskcache is not None:
+        return diskcache.Cache(CACHE_DIR)
+    if TTLCache is not None:
+        return TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL_SECS)
+    return {}
+
+# Shared instance
+agent_cache = LLMCache(_default_backend())
+
+if ChatOpenAI is not None:
+    class CachedChatOpenAI(ChatOpenAI):
+        """
+        ChatOpenAI that checks agent_cache before calling the API.
+        Also covers .bind_tools(...): the bound tools arrive in kwargs and are part of the key.
+        """
+        def _request_key(self, input, kwargs):
+            # Only what the API sees: message ids (uuids assigned by add_messages) and
+            # response metadata would make every run a new key
+            messages = [
+                {"type": m.type, "content": m.content, "tool_calls": getattr(m, "tool_calls", None)}
+                for m in self._convert_input(input).to_messages()
+            ]
+            # Every other option that changes the output: bound kwargs (tool_choice, stop,
+            # response_format, ...) and instance params (max_tokens, seed, ...).
+            # The stream flags only change how the same response is delivered.
+            extra = {
+                k: v for k, v in {**self._default_params, **kwargs}.items()
+                if k not in ("tools", "stream", "stream_options")
+            }
+            return agent_cache.cache_key(self.model_name, messages, self.temperature, kwargs.get("tools"), extra)
+
+        @staticmethod
+        def _fresh(message):
+            # Drop the stored id so add_messages appends the hit instead of replacing the original
+            return message.model_copy(update={"id": None})
+
+        def invoke(self, input, config=None, **kwargs):
+            key = self._request_key(input, kwargs)
+            hit = agent_cache.get(key)
+            if hit is not None:
+                return self._fresh(hit)
+            response = super().invoke(input, config, **kwargs)
+            agent_cache.set(key, response)
+            return response
+
+        async def ainvoke(self, input, config=None, **kwargs):
+            key = self._request_key(input, kwargs)
+            hit = agent_cache.get(key)
+            if hit is not None:
+                return self._fresh(hit)
+            response = await super().ainvoke(input, config, **kwargs)
+            agent_cache.set(key, response)
+            return response
+
+        async def astream(self, input, config=None, **kwargs):
+            key = self._request_key(input, kwargs)
+            hit = agent_cache.get(key)
+            if hit is not None:
+                # Replay the stored message as one chunk
+                yield AIMessageChunk(
+                    content=hit.content,
+                    tool_call_chunks=[
+                        {"name": tc["name"], "args": json.dumps(tc["args"]), "id": tc["id"], "index": i}
+                        for i, tc in enumerate(hit.tool_calls)
+                    ],
+                    usage_metadata=hit.usage_metadata,
+                    response_metadata=hit.response_metadata
+                )
+                return
+            full = None
+            async for chunk in super().astream(input, config, **kwargs):
+                full = chunk if full is None else full + chunk
+                yield chunk
+            # Only a stream read to the end is stored
+            if full is not None:
+                agent_cache.set(key, message_chunk_to_message(full))
@@ -0,0 +1,50 @@
+import os
+import asyncio
+
+from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+
+from common.openai_client import async_client
+
+# Rate-limit gate for every async chat completion in the course scripts.
+# - The semaphore caps in-flight requests so a big asyncio.gather stays under the
+#   account's QPM/TPM ceiling instead of tripping 429s.
+# - Retries with exponential backoff + jitter mean a single 429/5xx no longer
+#   blows up the whole gather.
+#
+# Usage:
+#   from common.llm_gate import guarded_create, guarded_response
+#   response = await guarded_create(model="gpt-4o", messages=[...])
+#   response = await guarded_response(model="gpt-4o", input=[...])  # Responses API
+
+# Gated calls retry only through tenacity below, outside the semaphore. The SDK's own
+# retries (max_retries=2 by default) would run inside the slot, sleeping while holding
+# it, and multiply with tenacity's attempts. with_options reuses the same pooled httpx
+# client; direct async_client users (files, batches, embeddings) keep the SDK retries.
+_gated_client = async_client.with_options(max_retries=0)
+
+_sem = asyncio.Semaphore(int(os.getenv("LLM_MAX_CONCURRENCY", 20)))
+
+# 429s, timeouts, dropped connections and 5xx are worth retrying; 4xx are not
+_RETRYABLE = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+_retry = retry(
+    wait=wait_exponential_jitter(initial=1, max=30),
+    stop=stop_after_attempt(5),
+    retry=retry_if_exception_type(_RETRYABLE),
+    reraise=True
+)
+
+@_retry
+async def guarded_create(**kwargs):
+    """Drop-in for `await async_client.chat.completions.create(**kwargs)`."""
+    # With stream=True the slot is released once the stream is opened;
+    # reading the chunks happens outside the gate.
+    async with _sem:
+        return await _gated_client.chat.completions.create(**kwargs)
+
+@_retry
+async def guarded_response(**kwargs):
+    """Drop-in for `await async_client.responses.create(**kwargs)`."""
+    async with _sem:
+        return await _gated_client.responses.create(**kwargs)
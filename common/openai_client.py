@@ -0,0 +1,37 @@
+import os
+import ssl
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+from dotenv import load_dotenv, find_dotenv
+
+# Shared OpenAI clients for every script in the course.
+# Each OpenAI(...) builds its own httpx pool and SSL context (~11ms each), and a
+# fresh pool means a fresh TLS handshake + DNS lookup on the first call.
+# Importing the clients from here gives one warm, pooled connection per process.
+#
+# Usage (from any WeekN script):
+#   sys.path.append(<repo root>)
+#   from common.openai_client import client, async_client
+
+# Search for .env from the directory the script is run from (e.g. Week1/)
+load_dotenv(find_dotenv(usecwd=True))
+
+# Build the SSL context once at import, reused by both clients
+_SHARED_SSL_CTX = ssl.create_default_context()
+
+_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+# The async client carries the scatter-gather fan-out, so it gets a wider pool
+_ASYNC_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=32)
+
+# Sync client (chat loops, tool calling)
+client = OpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    http_client=httpx.Client(verify=_SHARED_SSL_CTX, limits=_LIMITS)
+)
+
+# Async client (asyncio.gather fan-out)
+async_client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    http_client=httpx.AsyncClient(verify=_SHARED_SSL_CTX, limits=_ASYNC_LIMITS)
+)
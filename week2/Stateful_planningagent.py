@@ -1,11 +1,11 @@
 import json
 import time
 import os
+import sys
 from typing import List, TypedDict, Dict, Any, Optional
 
 # --- NEW IMPORTS FOR OPENAI ---
 try:
-    from openai import OpenAI
     from dotenv import load_dotenv
 except ImportError:
     print("Please install required packages: pip install openai python-dotenv")
@@ -24,7 +24,9 @@ if not api_key:
     # Fallback for demonstration if no key exists (prevents crash on run)
     client = None
 else:
-    client = OpenAI(api_key=api_key)
+    # Shared pooled client (one httpx pool + SSL context per process)
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # repo root, for common/
+    from common.openai_client import client
 
 # =============================================================================
 # HELPER: LLM WRAPPER
@@ -201,6 +203,12 @@ def run_router_pattern():
         "What are your office hours?"
     ]
     
+    # Category -> destination agent (anything unmatched goes to GENERAL INFO)
+    ROUTES = {
+        "BILLING": "BILLING AGENT",
+        "TECH": "TECH SUPPORT AGENT"
+    }
+
     # System prompt forces specific categories
     ROUTER_SYSTEM = "You are a support router. Classify queries into exactly one category: BILLING, TECH, or GENERAL. Output only the category name."
     
@@ -211,12 +219,9 @@ def run_router_pattern():
         # Cleaning response just in case
         category = category.strip().upper()
         
-        if "BILLING" in category:
-            print(f"Ticket: '{ticket}' -> Routed to BILLING AGENT")
-        elif "TECH" in category:
-            print(f"Ticket: '{ticket}' -> Routed to TECH SUPPORT AGENT")
-        else:
-            print(f"Ticket: '{ticket}' -> Routed to GENERAL INFO AGENT")
+        # Dict dispatch: normalize to a known key, then one lookup
+        key = next((k for k in ROUTES if k in category), None)
+        print(f"Ticket: '{ticket}' -> Routed to {ROUTES.get(key, 'GENERAL INFO AGENT')}")
 
 
 # =============================================================================
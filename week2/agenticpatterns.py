@@ -1,73 +1,216 @@
 import os
+import sys
 import json
 import asyncio
 import time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 
 # --- SETUP ---
 try:
-    from openai import OpenAI
     from dotenv import load_dotenv
 except ImportError:
     print("Please install required packages: pip install openai python-dotenv")
     exit(1)
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# Shared pooled client (one httpx pool + SSL context per process)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # repo root, for common/
+from common.openai_client import client, async_client
+from common.llm_gate import guarded_create
+from common.intent_router import classify_batch, MIN_CONFIDENCE
+from common.llm_cache import agent_cache
 
 # Helper for colorized output
 def print_step(pattern: str, step: str, content: str):
     print(f"\n[{pattern}] \033[92m{step}\033[0m: {content}")
 
-# Wrapper for OpenAI calls
-def call_llm(system: str, user: str, model: str = "gpt-4o", json_mode: bool = False) -> str:
-    if not client.api_key: return "Simulated Output (No API Key)"
-    
+# --- RESPONSE CACHE ---
+# Deterministic (temperature=0) calls go through the shared bounded cache in
+# common/llm_cache.py; sampled calls (the default 0.7) are never cached, so
+# creative outputs aren't frozen across runs.
+
+def normalize_query(text: str) -> str:
+    """Cache-key normalization: lowercase, strip, collapse whitespace."""
+    return " ".join(text.lower().split())
+
+def _build_request(system: str, user: str, model: str, json_mode: Union[bool, Dict], temperature: float = 0.7) -> Dict[str, Any]:
+    # json_mode=True asks for any JSON object; a {"name", "schema", "strict"} dict
+    # uses Structured Outputs, so the reply is guaranteed to match that schema
     kwargs = {
         "model": model,
         "messages": [{"role": "system", "content": system}, {"role": "user", "content": user}],
-        "temperature": 0.7
+        "temperature": temperature
     }
-    if json_mode: kwargs["response_format"] = {"type": "json_object"}
+    if isinstance(json_mode, dict): kwargs["response_format"] = {"type": "json_schema", "json_schema": json_mode}
+    elif json_mode: kwargs["response_format"] = {"type": "json_object"}
+    return kwargs
+
+def _cache_key(system: str, user: str, model: str, json_mode: Union[bool, Dict], temperature: float, normalize: bool):
+    # normalize=True makes near-identical queries ("Tell me a joke." vs "tell me a joke. ")
+    # share a cache entry. Only the key is normalized, the prompt is sent as-is.
+    request = _build_request(system, normalize_query(user) if normalize else user, model, json_mode, temperature)
+    return agent_cache.cache_key(model, request["messages"], temperature, extra={"json_mode": json_mode})
+
+# Wrapper for OpenAI calls
+def call_llm(system: str, user: str, model: str = "gpt-4o", json_mode: Union[bool, Dict] = False, normalize: bool = False, temperature: float = 0.7) -> str:
+    if not client.api_key: return "Simulated Output (No API Key)"
+
+    key = _cache_key(system, user, model, json_mode, temperature, normalize)
+    cached = agent_cache.get(key)
+    if cached is not None:
+        return cached
     
-    response = client.chat.completions.create(**kwargs)
-    return response.choices[0].message.content
+    response = client.chat.completions.create(**_build_request(system, user, model, json_mode, temperature))
+    content = response.choices[0].message.content
+    agent_cache.set(key, content)
+    return content
+
+# Async twin of call_llm (same cache), for fan-out with asyncio.gather
+async def acall_llm(system: str, user: str, model: str = "gpt-4o", json_mode: Union[bool, Dict] = False, normalize: bool = False, temperature: float = 0.7) -> str:
+    if not async_client.api_key: return "Simulated Output (No API Key)"
+
+    key = _cache_key(system, user, model, json_mode, temperature, normalize)
+    cached = agent_cache.get(key)
+    if cached is not None:
+        return cached
+
+    response = await guarded_create(**_build_request(system, user, model, json_mode, temperature))
+    content = response.choices[0].message.content
+    agent_cache.set(key, content)
+    return content
+
+# Set USE_BATCH_API=1 to send homogeneous classification queues through the Batch API
+USE_BATCH_API = os.getenv("USE_BATCH_API") == "1"
+
+class BatchProcessor:
+    """
+    Runs one system prompt over many inputs via the OpenAI Batch API.
+    One file upload replaces N requests and batch tokens are billed at 50%,
+    but results may take up to the completion window, so use it for bulk work.
+    """
+    def __init__(self, model: str = "gpt-4o", completion_window: str = "24h", poll_interval: float = 10.0, temperature: float = 0.7):
+        self.model = model
+        self.temperature = temperature
+        self.completion_window = completion_window
+        self.poll_interval = poll_interval
+
+    async def run_batch(self, task: str, inputs: List[str]) -> List[str]:
+        # 1. One JSONL line per input, tagged with its position
+        lines = [
+            json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": _build_request(task, query, self.model, False, self.temperature)
+            })
+            for i, query in enumerate(inputs)
+        ]
+        batch_file = await async_client.files.create(
+            file=("batch_input.jsonl", "\n".join(lines).encode()),
+            purpose="batch"
+        )
+
+        # 2. Submit and poll until the batch reaches a terminal state
+        batch = await async_client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window
+        )
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            print_step("Batch", "Polling", f"{batch.id} is {batch.status}...")
+            await asyncio.sleep(self.poll_interval)
+            batch = await async_client.batches.retrieve(batch.id)
+        if batch.status != "completed":
+            raise RuntimeError(f"Batch {batch.id} ended with status '{batch.status}'")
+
+        # A batch where every line failed still ends 'completed', but only has an error file
+        if batch.output_file_id is None:
+            detail = "no error file"
+            if batch.error_file_id:
+                errors = await async_client.files.content(batch.error_file_id)
+                first = json.loads(errors.text.splitlines()[0])
+                body = (first.get("response") or {}).get("body") or {}
+                detail = first.get("error") or body.get("error") or first
+            raise RuntimeError(f"Batch {batch.id}: all {len(inputs)} requests failed, e.g. {detail}")
+
+        # 3. Map custom_id -> content (failed lines come back without a response body)
+        output = await async_client.files.content(batch.output_file_id)
+        results: Dict[str, str] = {}
+        for line in output.text.splitlines():
+            row = json.loads(line)
+            body = (row.get("response") or {}).get("body") or {}
+            if body.get("choices"):
+                results[row["custom_id"]] = body["choices"][0]["message"]["content"]
+        return [results.get(str(i), "") for i in range(len(inputs))]
 
 # =============================================================================
 # PATTERN 1: PROMPT CHAINING (The Saga Pattern)
 # Sequential decomposition: Step A Output -> Step B Input
 # =============================================================================
+# Structured Outputs schema for the chain: json_object mode only guarantees valid
+# JSON, so ingredients could come back as objects and break the join below
+CHAIN_SCHEMA = {
+    "name": "kitchen_chain",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "meal": {"type": "string"},
+            "ingredients": {"type": "array", "items": {"type": "string"}},
+            "shopping_list": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"aisle": {"type": "string"}, "item": {"type": "string"}},
+                    "required": ["aisle", "item"],
+                    "additionalProperties": False
+                }
+            }
+        },
+        "required": ["meal", "ingredients", "shopping_list"],
+        "additionalProperties": False
+    }
+}
+
 def pattern_prompt_chaining():
     print("\n--- PATTERN 1: PROMPT CHAINING ---")
     user_input = "I want to cook a romantic dinner for 2, vegetarian, under 30 mins."
 
-    # Step 1: Ideation (Extract Criteria -> Generate Idea)
-    step1_response = call_llm(
-        system="You are a Chef. Suggest ONE meal name based on constraints.",
-        user=user_input
+    # The 3 links of the chain (Idea -> Ingredients -> Shopping List) run inside
+    # ONE structured call instead of 3 client-side round-trips.
+    chain_response = call_llm(
+        system="""You run a 3-step kitchen chain and return the result of every step.
+        Step 1 (Chef): Suggest ONE meal name based on the constraints.
+        Step 2 (Sous Chef): List the ingredients for that meal.
+        Step 3 (Clerk): Convert the ingredients into a shopping list with 'aisle' and 'item'.
+        Return a JSON object with the meal, its ingredients and the shopping list.""",
+        user=user_input,
+        json_mode=CHAIN_SCHEMA
     )
-    print_step("Chain", "Step 1 (Idea)", step1_response)
 
-    # Step 2: Recipe Generation (Idea -> Ingredients)
-    step2_response = call_llm(
-        system="You are a Sous Chef. List ingredients for the provided meal name as a CSV list.",
-        user=step1_response
-    )
-    print_step("Chain", "Step 2 (Ingredients)", step2_response)
+    try:
+        chain = json.loads(chain_response)
+    except json.JSONDecodeError:
+        print_step("Chain", "Error", f"Invalid JSON response: {chain_response}")
+        return
 
-    # Step 3: Shopping List (Ingredients -> Formatted JSON)
-    step3_response = call_llm(
-        system="You are a Clerk. Convert CSV ingredients to a JSON object with 'aisle' and 'item'.",
-        user=step2_response,
-        json_mode=True
-    )
-    print_step("Chain", "Step 3 (JSON)", step3_response)
+    print_step("Chain", "Step 1 (Idea)", chain.get("meal"))
+    print_step("Chain", "Step 2 (Ingredients)", ", ".join(chain.get("ingredients", [])))
+    print_step("Chain", "Step 3 (JSON)", json.dumps({"shopping_list": chain.get("shopping_list", [])}))
 
 # =============================================================================
 # PATTERN 2: ROUTING (Dynamic Dispatch)
 # Input -> Classifier -> Specialized Worker
 # =============================================================================
-def pattern_routing():
+# Category -> specialist system prompt (anything unmatched goes to GENERAL)
+SPECIALISTS = {
+    "BILLING": "You are a Billing Agent. Be empathetic.",
+    "TECHNICAL": "You are a Tech Support. Be precise."
+}
+GENERAL_SPECIALIST = "You are a Chatbot. Be witty."
+
+async def pattern_routing():
     print("\n--- PATTERN 2: ROUTING ---")
     inputs = [
         "My bill is wrong, I was charged twice.",
@@ -83,32 +226,40 @@ def pattern_routing():
     Output only the category name.
     """
 
-    for query in inputs:
-        # 1. The Router decides WHERE to go
-        category = call_llm(ROUTER_SYSTEM, query).strip().upper()
-        
-        # 2. Dispatch to specialized logic
-        if "BILLING" in category:
-            response = call_llm("You are a Billing Agent. Be empathetic.", query)
-            print_step("Router", f"Route: BILLING", response)
-        elif "TECHNICAL" in category:
-            response = call_llm("You are a Tech Support. Be precise.", query)
-            print_step("Router", f"Route: TECHNICAL", response)
+    # 1. The Router decides WHERE to go
+    # Local embedding classifier first (one batched pass); only low-confidence queries pay for an LLM call
+    routes = []
+    unsure = []
+    for i, (label, score) in enumerate(classify_batch(inputs)):
+        routes.append(label if label is not None and score >= MIN_CONFIDENCE else None)
+        if routes[i] is None:
+            unsure.append(i)
+
+    if unsure:
+        unsure_queries = [inputs[i] for i in unsure]
+        if USE_BATCH_API:
+            # Same prompt over a queue of inputs: submit it as one batch job
+            categories = await BatchProcessor(temperature=0).run_batch(ROUTER_SYSTEM, unsure_queries)
         else:
-            response = call_llm("You are a Chatbot. Be witty.", query)
-            print_step("Router", f"Route: GENERAL", response)
+            # temperature=0: classification must be deterministic, which also makes it cacheable
+            categories = await asyncio.gather(*[acall_llm(ROUTER_SYSTEM, query, normalize=True, temperature=0) for query in unsure_queries])
+        for i, category in zip(unsure, categories):
+            routes[i] = category.strip().upper()
+
+    # 2. Dispatch to specialized logic (all specialists run concurrently)
+    # Normalize each route to a known key, then a dict lookup picks the specialist
+    categories = [next((k for k in SPECIALISTS if k in route), "GENERAL") for route in routes]
+    responses = await asyncio.gather(*[
+        acall_llm(SPECIALISTS.get(category, GENERAL_SPECIALIST), query)
+        for category, query in zip(categories, inputs)
+    ])
+    for category, response in zip(categories, responses):
+        print_step("Router", f"Route: {category}", response)
 
 # =============================================================================
 # PATTERN 3: PARALLELIZATION (Scatter-Gather)
 # Input -> Multiple Parallel Sub-tasks -> Aggregator
 # =============================================================================
-async def async_call_llm(system, user, tag):
-    """Async wrapper for OpenAI to demonstrate parallel execution"""
-    # Note: In Python, OpenAI client is sync by default. 
-    # For true async, use AsyncOpenAI. Here we simulate using threads/async wrapper.
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, call_llm, system, user)
-
 async def pattern_parallelization():
     print("\n--- PATTERN 3: PARALLELIZATION (SCATTER-GATHER) ---")
     topic = "The Future of AI in 2030"
@@ -116,9 +267,9 @@ async def pattern_parallelization():
     # Scatter: Launch 3 distinct perspectives simultaneously
     print_step("Parallel", "Scatter", f"Generating 3 perspectives on '{topic}'...")
     
-    task1 = async_call_llm("You are an Optimist.", f"Write 1 sentence on {topic}.", "Optimist")
-    task2 = async_call_llm("You are a Pessimist.", f"Write 1 sentence on {topic}.", "Pessimist")
-    task3 = async_call_llm("You are a Realist.", f"Write 1 sentence on {topic}.", "Realist")
+    task1 = acall_llm("You are an Optimist.", f"Write 1 sentence on {topic}.")
+    task2 = acall_llm("You are a Pessimist.", f"Write 1 sentence on {topic}.")
+    task3 = acall_llm("You are a Realist.", f"Write 1 sentence on {topic}.")
 
     # Gather: Wait for all to finish
     results = await asyncio.gather(task1, task2, task3)
@@ -126,19 +277,19 @@ async def pattern_parallelization():
     combined_input = f"Optimist: {results[0]}\nPessimist: {results[1]}\nRealist: {results[2]}"
     
     # Aggregator: Synthesize
-    final_summary = call_llm("You are a Synthesizer. Combine these views into a balanced conclusion.", combined_input)
+    final_summary = await acall_llm("You are a Synthesizer. Combine these views into a balanced conclusion.", combined_input)
     print_step("Parallel", "Gather (Synthesis)", final_summary)
 
 # =============================================================================
 # PATTERN 4: ORCHESTRATOR-WORKERS (Saga Orchestration)
 # Orchestrator plans -> Delegates to Workers -> Compiles results
 # =============================================================================
-def pattern_orchestrator():
+async def pattern_orchestrator():
     print("\n--- PATTERN 4: ORCHESTRATOR-WORKERS ---")
     complex_task = "Write a blog post about coffee. Section 1: History. Section 2: Health Benefits."
 
     # 1. Orchestrator: Breakdown
-    plan_response = call_llm(
+    plan_response = await acall_llm(
         system="You are an Editor. Break the blog topic into exactly 2 sub-task prompts for writers. Return JSON list ['task1', 'task2'].",
         user=complex_task,
         json_mode=True
@@ -153,13 +304,10 @@ def pattern_orchestrator():
 
     print_step("Orchestrator", "Plan", str(tasks))
 
-    # 2. Workers: Execute sub-tasks
-    results = []
-    for i, task in enumerate(tasks):
-        # In a real system, these could run in parallel
-        worker_output = call_llm("You are a Blog Writer. Write 1 short paragraph.", task)
+    # 2. Workers: Execute sub-tasks in parallel
+    results = await asyncio.gather(*[acall_llm("You are a Blog Writer. Write 1 short paragraph.", task) for task in tasks])
+    for i, worker_output in enumerate(results):
         print_step("Orchestrator", f"Worker {i+1}", worker_output)
-        results.append(worker_output)
 
     # 3. Orchestrator: Final Compile
     final_doc = "\n\n".join(results)
@@ -208,21 +356,25 @@ def pattern_evaluator_optimizer():
 # =============================================================================
 # MAIN
 # =============================================================================
-if __name__ == "__main__":
-    if not client.api_key:
-        print("WARNING: No API Key found. Results will be simulated/mocked.")
-    
+async def main():
     # 1. Prompt Chaining
     pattern_prompt_chaining()
     
-    # 2. Routing
-    pattern_routing()
+    # 2. Routing (Async)
+    await pattern_routing()
     
     # 3. Parallelization (Async)
-    asyncio.run(pattern_parallelization())
+    await pattern_parallelization()
     
-    # 4. Orchestrator
-    pattern_orchestrator()
+    # 4. Orchestrator (Async)
+    await pattern_orchestrator()
     
     # 5. Evaluator-Optimizer
-    pattern_evaluator_optimizer()
\ No newline at end of file
+    pattern_evaluator_optimizer()
+
+if __name__ == "__main__":
+    if not client.api_key:
+        print("WARNING: No API Key found. Results will be simulated/mocked.")
+    
+    # One event loop for all async patterns so the async client's pool is reused
+    asyncio.run(main())
@@ -1,11 +1,11 @@
 import json
 import time
 import os
+import sys
 from typing import List, TypedDict, Dict, Any, Optional
 
 # --- SETUP ---
 try:
-    from openai import OpenAI
     from dotenv import load_dotenv
 except ImportError:
     print("Please install required packages: pip install openai python-dotenv")
@@ -18,7 +18,9 @@ if not api_key:
     print("WARNING: OPENAI_API_KEY not found. Please set it in your .env file.")
     client = None
 else:
-    client = OpenAI(api_key=api_key)
+    # Shared pooled client (one httpx pool + SSL context per process)
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # repo root, for common/
+    from common.openai_client import client
 
 
 # =============================================================================
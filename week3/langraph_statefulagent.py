@@ -1,7 +1,7 @@
 import os
+import asyncio
 import operator
 from typing import Annotated, TypedDict, List, Union
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 from langgraph.graph import StateGraph, END
 from dotenv import load_dotenv
@@ -16,30 +16,24 @@ class AgentState(TypedDict):
     plan: List[str]
     final_answer: str
 
-# Initialize LLM
-llm = ChatOpenAI(model="gpt-4", temperature=0)
-
 # --- 2. Define Nodes ---
 
-def planner_node(state: AgentState):
+async def planner_node(state: AgentState):
     print("--- PLANNER NODE ---")
-    messages = state['messages']
-    # Simple prompt to generate a plan
-    plan_response = llm.invoke([
-        HumanMessage(content="You are a planner. Generate a list of 3 steps to solve: " + messages[-1].content)
-    ])
-    # Mocking a parsed list for the demo
+    # Mocking the plan for the demo. There is deliberately no LLM call here: its
+    # answer was never parsed, so it only added a GPT-4 round-trip per run.
+    # To plan for real, use llm.with_structured_output(PlanSchema) and read .plan.
     plan = ["Step 1: Research", "Step 2: Draft", "Step 3: Review"] 
     return {"plan": plan, "current_step": "plan_created"}
 
-def executor_node(state: AgentState):
+async def executor_node(state: AgentState):
     print("--- EXECUTOR NODE ---")
     plan = state['plan']
     # Simulate executing the plan
     execution_log = f"Executed {len(plan)} steps successfully."
     return {"messages": [AIMessage(content=execution_log)], "current_step": "executed"}
 
-def reviewer_node(state: AgentState):
+async def reviewer_node(state: AgentState):
     print("--- REVIEWER NODE ---")
     # Simulate a review process
     return {"final_answer": "Task Completed and Verified.", "current_step": "finished"}
@@ -87,10 +81,13 @@ workflow.add_conditional_edges(
 app = workflow.compile()
 
 # --- 5. Run the Agent ---
-if __name__ == "__main__":
+async def main():
     print("--- LangGraph Stateful Demo ---")
     inputs = {"messages": [HumanMessage(content="Write a report on AI.")]}
-    for output in app.stream(inputs):
+    async for output in app.astream(inputs):
         for key, value in output.items():
             print(f"Finished Node: {key}")
-            # print(f"Current State: {value}")
\ No newline at end of file
+            # print(f"Current State: {value}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
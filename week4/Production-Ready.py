@@ -1,8 +1,12 @@
-import json
 import time
 import os
+import asyncio
+import sys
 import re
-from typing import Dict, Any, List, Optional
+import queue
+import atexit
+import threading
+from typing import Dict, Any, List, Tuple
 from datetime import datetime
 
 
@@ -10,23 +14,76 @@ from datetime import datetime
 
 # Guardrails: A decorator @guardrail_pii that scans agent outputs for sensitive data (emails) and redacts them.
 
-# Caching: A simple semantic cache simulation to avoid redundant LLM calls.
+# Caching: An exact-match cache plus a semantic (embedding) cache to avoid redundant LLM calls.
 
 # End-to-End Flow: A secure, observable agent that processes a user request using these production modules.
 # --- SETUP ---
 try:
-    from openai import OpenAI
+    import orjson
     from dotenv import load_dotenv
 except ImportError:
-    print("Please install required packages: pip install openai python-dotenv")
+    print("Please install required packages: pip install openai python-dotenv orjson tenacity")
     exit(1)
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # repo root, for common/
+# Shared pooled AsyncOpenAI client; guarded_create adds the concurrency cap + retries
+from common.openai_client import async_client
+from common.llm_gate import guarded_create
+from common.llm_cache import agent_cache, SemanticCache
+
+MODEL = "gpt-4o"
 
 # =============================================================================
 # MODULE 1: OBSERVABILITY (Tracing)
 # =============================================================================
+TRACE_FILE = "agent_traces.jsonl"
+
+# Spans are handed to a background writer so file I/O never sits on the request path.
+# The fd is opened once, O_APPEND, and each batch is one buffer handed to write(2): no per-span
+# open/close, and no Python buffering layer that would need flushing.
+_TRACE_FD = os.open(TRACE_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+_TRACE_Q = queue.Queue()
+
+def _trace_writer():
+    while True:
+        batch = [_TRACE_Q.get()]
+        # Drain whatever else is already queued in the same pass
+        while True:
+            try:
+                batch.append(_TRACE_Q.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            lines = []
+            for span in batch:
+                # One bad span is skipped, not allowed to kill the writer thread
+                try:
+                    # orjson encodes in C and serializes the datetime fields natively.
+                    # OPT_NON_STR_KEYS + default=str keep accepting what json.dumps(default=str) did.
+                    lines.append(orjson.dumps(
+                        span,
+                        option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS,
+                        default=str
+                    ))
+                except Exception as e:
+                    print(f"   [Trace] Dropped span {span.get('span_name')}: {e}")
+            # write(2) may write fewer bytes than asked; finish the batch so no line is cut
+            data = memoryview(b"".join(lines))
+            while data:
+                data = data[os.write(_TRACE_FD, data):]
+        except OSError as e:
+            print(f"   [Trace] Failed to write {len(batch)} spans: {e}")
+        finally:
+            # Always ack, or atexit's _TRACE_Q.join() would hang forever
+            for _ in batch:
+                _TRACE_Q.task_done()
+
+threading.Thread(target=_trace_writer, name="trace-writer", daemon=True).start()
+# Daemon threads die with the process, so wait for queued spans at exit
+atexit.register(_TRACE_Q.join)
+
 class Tracer:
     """
     Simulates a production tracing system (like LangSmith or Arize).
@@ -40,7 +97,7 @@ class Tracer:
         span = {
             "trace_id": self.trace_id,
             "span_name": name,
-            "start_time": datetime.now().isoformat(),
+            "start_time": datetime.now(),
             "input": input_data,
             "status": "RUNNING"
         }
@@ -49,33 +106,36 @@ class Tracer:
 
     def end_span(self, span_index: int, output_data: Any):
         span = self.spans[span_index]
-        span["end_time"] = datetime.now().isoformat()
+        span["end_time"] = datetime.now()
         span["output"] = output_data
         span["status"] = "COMPLETED"
         self._log_to_file(span)
 
     def _log_to_file(self, span: Dict):
-        # In prod, this would send an async HTTP request to a collector
-        with open("agent_traces.jsonl", "a") as f:
-            f.write(json.dumps(span) + "\n")
+        # Enqueue and return; _trace_writer does the actual write.
+        # In a multi-process deployment, POST to a collector instead (fire-and-forget task).
+        _TRACE_Q.put(span)
         print(f"   [Trace] Logged span: {span['span_name']}")
 
 # =============================================================================
 # MODULE 2: SECURITY (Guardrails)
 # =============================================================================
+# Regex for email detection, compiled once at import
+_EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+
 def guardrail_pii(func):
     """
     Output Guardrail: Scans the function's return value for PII (emails).
     If found, it redacts them before returning to the user.
     """
-    def wrapper(*args, **kwargs):
-        result = func(*args, **kwargs)
-        
-        # Regex for email detection
-        email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
+    async def wrapper(*args, **kwargs):
+        result = await func(*args, **kwargs)
         
+        # Fast path: no '@' means no email to redact
+        if isinstance(result, str) and '@' not in result:
+            return result
         if isinstance(result, str):
-            redacted_result = re.sub(email_pattern, "[REDACTED_EMAIL]", result)
+            redacted_result = _EMAIL_RE.sub("[REDACTED_EMAIL]", result)
             if redacted_result != result:
                 print("   [Guardrail] 🛡️ ALERT: PII detected and redacted.")
             return redacted_result
@@ -85,22 +145,65 @@ def guardrail_pii(func):
 # =============================================================================
 # MODULE 3: SCALING (Caching)
 # =============================================================================
-# In prod, use Redis. Here we use a simple dict.
-CACHE_STORE = {}
+# Shared content-addressed cache (common/llm_cache.py): the key hashes the exact
+# request (model, messages, temperature), not the raw user query. Entries expire
+# after an hour; it persists across runs when diskcache is installed, otherwise it
+# is an LRU-bounded TTLCache. Hit/miss counters are in llm_cache.stats.
+llm_cache = agent_cache
+
+# Paraphrase tier: embed the query and reuse the answer of any prior query with
+# cosine similarity >= 0.92. Same one-hour TTL and size cap as the exact tier, so an
+# expired answer is not served back through a paraphrase (or the same query) either.
+# Needs hnswlib; the exact tier works without it.
+EMBED_MODEL = "text-embedding-3-small"
+try:
+    semantic_cache = SemanticCache(dim=1536, threshold=0.92, path="cache.pkl")
+except ImportError:
+    semantic_cache = None
 
-def check_cache(prompt: str) -> Optional[str]:
-    # In prod, we would embed the prompt and do a vector similarity search
-    # Here we do exact match for simplicity
-    return CACHE_STORE.get(prompt)
+async def embed(text: str) -> List[float]:
+    response = await async_client.embeddings.create(model=EMBED_MODEL, input=text)
+    return response.data[0].embedding
 
-def update_cache(prompt: str, response: str):
-    CACHE_STORE[prompt] = response
+def build_messages(user_query: str) -> List[Dict]:
+    # We explicitly ask the model to include an email to test the guardrail
+    prompt = f"{user_query}. Include a contact email in your response."
+    return [{"role": "user", "content": prompt}]
+
+# Concurrent identical requests share one in-flight lookup (cache key -> task), so a
+# gather of duplicate queries makes a single embeddings + completion call instead of
+# racing past the cache. The caches are written once, inside the shared task.
+_inflight: Dict[str, asyncio.Task] = {}
+
+async def _complete(messages: List[Dict]) -> str:
+    completion = await guarded_create(
+        model=MODEL,
+        messages=messages,
+        temperature=0  # Deterministic, so the answer is safe to cache
+    )
+    return completion.choices[0].message.content
+
+async def _resolve(user_query: str, messages: List[Dict], cache_key: str) -> Tuple[str, str]:
+    """Semantic tier, then the LLM. Returns (response, source) and fills both caches."""
+    embedding = None
+    if semantic_cache is not None:
+        embedding = await embed(user_query)
+        cached = semantic_cache.get(embedding)
+        if cached:
+            print("   [Cache] ⚡ Semantic hit! Returning cached response.")
+            return cached, "semantic_cache"
+
+    response = await _complete(messages)
+    llm_cache.set(cache_key, response)
+    if embedding is not None:
+        semantic_cache.add(embedding, user_query, response)
+    return response, "llm"
 
 # =============================================================================
 # CORE: THE PRODUCTION AGENT
 # =============================================================================
 @guardrail_pii
-def secure_agent_executor(user_query: str, tracer: Tracer) -> str:
+async def secure_agent_executor(user_query: str, tracer: Tracer) -> str:
     """
     A robust function that runs the agent logic wrapped with 
     Tracing, Caching, and Guardrails.
@@ -110,55 +213,88 @@ def secure_agent_executor(user_query: str, tracer: Tracer) -> str:
     span_idx = tracer.start_span("secure_agent_execution", user_query)
     
     # 2. Check Cache
-    cached = check_cache(user_query)
+    messages = build_messages(user_query)
+    cache_key = llm_cache.cache_key(MODEL, messages, temperature=0)
+    cached = llm_cache.get(cache_key)
     if cached:
         print("   [Cache] ⚡ Hit! Returning cached response.")
-        tracer.end_span(span_idx, {"source": "cache", "response": cached})
+        tracer.end_span(span_idx, {"source": "cache", "response": cached, "cache_stats": dict(llm_cache.stats)})
         return cached
 
     # 3. Call LLM (Simulated Work)
-    if not client.api_key:
+    if not async_client.api_key:
         # Mock response if no key
         response = f"Sure, I can help. Contact support at admin@company.com for details."
+        llm_cache.set(cache_key, response)
+        source = "llm"
     else:
+        # Join an identical request already in flight before spending an embeddings call
+        task = _inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(_resolve(user_query, messages, cache_key))
+            _inflight[cache_key] = task
+            task.add_done_callback(lambda _, key=cache_key: _inflight.pop(key, None))
+            shared = False
+        else:
+            print("   [Cache] ⏳ Same query in flight, waiting for its response.")
+            shared = True
         try:
-            # We explicitly ask the model to include an email to test the guardrail
-            prompt = f"{user_query}. Include a contact email in your response."
-            completion = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}]
-            )
-            response = completion.choices[0].message.content
+            response, source = await task
         except Exception as e:
-            response = f"Error: {e}"
-
-    # 4. Update Cache
-    update_cache(user_query, response)
+            response, source = f"Error: {e}", "error"  # Never cached
+        if shared and source != "error":
+            source = "inflight"
     
-    # 5. End Trace
-    tracer.end_span(span_idx, {"source": "llm", "response": response})
+    # 4. End Trace
+    stats = semantic_cache.stats if source == "semantic_cache" else llm_cache.stats
+    tracer.end_span(span_idx, {"source": source, "response": response, "cache_stats": dict(stats)})
     
     return response
 
 # =============================================================================
 # MAIN EXECUTION
 # =============================================================================
-if __name__ == "__main__":
+async def main():
     print("--- Week 4: Production Agent Demo ---\n")
     
     # Initialize Observability
     trace_id = f"trace_{int(time.time())}"
     tracer = Tracer(trace_id)
     
-    # Test 1: First Run (LLM Call + Guardrail Check)
-    print(f"1. Processing Query (Trace ID: {trace_id})")
+    # Test 1 + 2: Same Query Twice, Concurrently (LLM Call + Guardrail Check, then Cache)
+    # The second request finds the first one in flight and shares its response
+    # (one embeddings call, one completion; its span is logged with source "inflight").
+    print(f"1-2. Processing Same Query Twice, Concurrently (Trace ID: {trace_id})")
     query = "How do I reset my password?"
-    result = secure_agent_executor(query, tracer)
-    print(f"   [Agent Output]: {result}\n")
-    
-    # Test 2: Second Run (Cache Hit)
-    print("2. Processing Same Query (Testing Cache)")
-    result_cached = secure_agent_executor(query, tracer)
+    result, result_cached = await asyncio.gather(
+        secure_agent_executor(query, tracer),
+        secure_agent_executor(query, tracer)
+    )
+    print(f"   [Agent Output]: {result}")
     print(f"   [Agent Output]: {result_cached}\n")
     
-    print("--- Demo Complete. Check 'agent_traces.jsonl' for logs. ---")
\ No newline at end of file
+    # Test 3: Paraphrased Query (Semantic Cache Hit)
+    print("3. Processing Paraphrased Query (Testing Semantic Cache)")
+    result_semantic = await secure_agent_executor("How can I reset my password", tracer)
+    print(f"   [Agent Output]: {result_semantic}\n")
+    
+    # Batch mode (opt-in): one query per line on stdin, e.g.
+    # `python Production-Ready.py --stdin < queries.txt`. An explicit flag, because an
+    # inherited non-tty stdin (IDE runners, subprocess pipes) would otherwise block on EOF.
+    # All queries are fired at once; guarded_create caps in-flight requests
+    # (LLM_MAX_CONCURRENCY) and retries 429s with backoff.
+    if "--stdin" in sys.argv[1:]:
+        queries = [line.strip() for line in sys.stdin if line.strip()]
+        print(f"4. Processing {len(queries)} Queries from stdin")
+        results = await asyncio.gather(*(secure_agent_executor(q, tracer) for q in queries))
+        for q, r in zip(queries, results):
+            print(f"   [{q}] -> {r}")
+        print()
+    
+    if semantic_cache is not None:
+        semantic_cache.save()
+    
+    print("--- Demo Complete. Check 'agent_traces.jsonl' for logs. ---")
+
+if __name__ == "__main__":
+    asyncio.run(main())